@@ -23,10 +23,9 @@ Flow:
         - If not, show error and prompt for a different enchantment.
     5. Validate that `enchantment_level` is between 1 and `max_level`.
     6. Validate that `cost_emeralds` is between 1 and 64.
-    7. Check for duplicate trade (same villager_id, enchantment, level, and cost).
+    7. Insert new trade into `librarian_trades` table unless it is a duplicate (same villager_id, enchantment, level, and cost).
         - If duplicate exists, prompt user to confirm if they want to add it anyway.
-    8. If all validations pass, insert new trade into `librarian_trades` table.
-    9. After each entry, prompt user if they want to add another trade or exit.
+    8. After each entry, prompt user if they want to add another trade or exit.
 
 Input:
 - location (string): Name of the location of the trading hall (e.g. 'spawn')
@@ -41,26 +40,116 @@ Output:
 - Else add new row to `librarian_trades` table (`villager_id`, `enchantment`, `enchantment_level`, `cost_emeralds`)
 """
 
+import atexit
 import os
 import sqlite3
 
 # --- CONFIGURATION ---
 
 DB_NAME = 'mc_trading.db'
+MAX_TRADES = 4
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 DB_PATH = os.path.join(parent_dir, DB_NAME)
 
+# --- SQL STATEMENTS ---
+# Kept as constants so identical SQL text hits the connection's statement cache
+
+SQL_LIST_LOCATIONS = 'SELECT location FROM locations'
+SQL_INSERT_LOCATION = 'INSERT INTO locations (location, x_coord, z_coord) VALUES (?, ?, ?)'
+
+SQL_GET_VILLAGER = 'SELECT job, location FROM villagers WHERE villager_id = ?'
+SQL_MOVE_VILLAGER = 'UPDATE villagers SET location = ? WHERE villager_id = ?'
+SQL_INSERT_VILLAGER = "INSERT INTO villagers (villager_id, location, job) VALUES (?, ?, 'librarian')"
+
+SQL_GET_MAX_LEVEL = 'SELECT max_level FROM enchantments WHERE enchantment = ?'
+
+# Bounded so the scan stops once the villager's trade slots are full
+SQL_COUNT_TRADES = 'SELECT COUNT(*) FROM (SELECT 1 FROM librarian_trades WHERE villager_id = ? LIMIT ?)'
+SQL_INSERT_TRADE_IF_NEW = """
+    INSERT INTO librarian_trades (villager_id, enchantment, enchantment_level, cost_emeralds)
+    SELECT :v_id, :ench, :level, :cost
+    WHERE NOT EXISTS (
+        SELECT 1 FROM librarian_trades
+        WHERE villager_id = :v_id AND enchantment = :ench AND enchantment_level = :level AND cost_emeralds = :cost
+    )
+"""
+SQL_LIST_TABLES = "SELECT name FROM sqlite_master WHERE type = 'table'"
+SQL_CREATE_INDEXES = """
+    CREATE INDEX IF NOT EXISTS idx_librarian_trades_dup
+        ON librarian_trades (villager_id, enchantment, enchantment_level, cost_emeralds);
+    CREATE INDEX IF NOT EXISTS idx_villagers_location ON villagers (location);
+"""
+SQL_INSERT_TRADE = """
+    INSERT INTO librarian_trades (villager_id, enchantment, enchantment_level, cost_emeralds)
+    VALUES (?, ?, ?, ?)
+"""
+
+# --- DATABASE CONNECTION ---
+
+# Created by the ETL script (enchantments, jobs) or by hand from README.md (the rest)
+REQUIRED_TABLES = ('enchantments', 'jobs', 'locations', 'villagers', 'librarian_trades')
+
+class SchemaError(Exception):
+    """Raised when tables this script needs haven't been created yet."""
+
+_conn = None
+_cursor = None
+
+# villager_id -> (job, location) for villagers already looked up or written this session
+_villager_cache = {}
+
+def get_connection():
+    """Open the database once per session and return the shared connection and cursor."""
+    global _conn, _cursor
+    if _conn is None:
+        conn = sqlite3.connect(DB_PATH, cached_statements=128)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('PRAGMA foreign_keys = ON;')
+            cursor.execute('PRAGMA journal_mode = WAL;')
+            cursor.execute('PRAGMA synchronous = NORMAL;')
+            cursor.execute('PRAGMA temp_store = MEMORY;')
+            cursor.execute('PRAGMA cache_size = -65536;')  # 64 MiB
+            cursor.execute('PRAGMA mmap_size = 268435456;')  # 256 MiB
+
+            existing_tables = {row[0] for row in cursor.execute(SQL_LIST_TABLES)}
+            missing_tables = [t for t in REQUIRED_TABLES if t not in existing_tables]
+            if missing_tables:
+                raise SchemaError(f'Missing table(s): {", ".join(missing_tables)}. '
+                                  'Run the ETL script and create the tables listed in README.md first.')
+
+            cursor.executescript(SQL_CREATE_INDEXES)
+        except (sqlite3.Error, SchemaError):
+            # Don't cache a half-configured connection
+            conn.close()
+            raise
+        _conn, _cursor = conn, cursor
+    return _conn, _cursor
+
+@atexit.register
+def close_connection():
+    """Close the shared connection, if one was opened."""
+    global _conn, _cursor
+    if _conn is not None:
+        _conn.close()
+        _conn = None
+        _cursor = None
+
 # --- INPUT HELPER FUNCTIONS ---
 
-def get_location(cursor, conn):
-    """Loop until a valid location is confirmed or added."""
+def get_location(cursor, pending):
+    """Loop until a valid location is confirmed or added.
+
+    New locations are queued in `pending` and written once all input is collected.
+    """
+    # Load existing locations once; retries reuse the in-memory set
+    valid_locations = {row[0] for row in cursor.execute(SQL_LIST_LOCATIONS)}
+
     while True:
         # Return list of existing locations for user reference
-        cursor.execute('SELECT location FROM locations')
-        valid_locations = sorted([row[0] for row in cursor.fetchall()])
-        print(f'\nExisting locations: {", ".join(valid_locations) if valid_locations else "None"}')
+        print(f'\nExisting locations: {", ".join(sorted(valid_locations)) if valid_locations else "None"}')
 
         loc = input('Trading hall location (e.g. "spawn"): ').strip().lower()
         if not loc:
@@ -68,8 +157,7 @@ def get_location(cursor, conn):
             continue
 
         # Check if location exists in 'locations' table
-        cursor.execute('SELECT 1 FROM locations WHERE location = ?', (loc,))
-        if cursor.fetchone():
+        if loc in valid_locations:
             return loc
 
         # Confirmation steps for new location
@@ -85,12 +173,10 @@ def get_location(cursor, conn):
                     except ValueError:
                         print('❌ Error: Coordinates must be numbers. Try again.')
 
-                cursor.execute("""
-                    INSERT INTO locations (location, x_coord, z_coord)
-                    VALUES (?, ?, ?)
-                """, (loc, x, z))
-                conn.commit()
-                print(f'Added new location "{loc}" with coordinates ({x}, {z}).')
+                pending.append((SQL_INSERT_LOCATION, (loc, x, z),
+                                f'Added new location "{loc}" with coordinates ({x}, {z}).'))
+                valid_locations.add(loc)
+                print(f'Will add new location "{loc}" with coordinates ({x}, {z}) when this entry is saved.')
                 return loc
             elif confirm == 'n':
                 print('❌ Action cancelled. Please enter a different location.')
@@ -98,8 +184,11 @@ def get_location(cursor, conn):
             else:
                 print('Invalid input. Please enter "y" or "n".')
 
-def get_villager_id(cursor, conn, current_loc):
-    """Loop until a valid villager ID is confirmed."""
+def get_villager_id(cursor, current_loc, pending):
+    """Loop until a valid villager ID is confirmed.
+
+    New or moved villagers are queued in `pending` and written once all input is collected.
+    """
     while True:
         v_id = input('\nVillager ID (e.g. "spa001"): ').strip().lower()
         if not v_id:
@@ -107,8 +196,12 @@ def get_villager_id(cursor, conn, current_loc):
             continue
 
         # Check if villager exists and if they are a librarian
-        cursor.execute('SELECT job, location FROM villagers WHERE villager_id = ?', (v_id,))
-        existing = cursor.fetchone()
+        existing = _villager_cache.get(v_id)
+        if existing is None:
+            cursor.execute(SQL_GET_VILLAGER, (v_id,))
+            existing = cursor.fetchone()
+            if existing:
+                _villager_cache[v_id] = existing
 
         if existing:
             job, registered_loc = existing
@@ -125,9 +218,10 @@ def get_villager_id(cursor, conn, current_loc):
                 while True:
                     move = input(f'Move them to "{current_loc}"? (y/n): ').strip().lower()
                     if move == 'y':
-                        cursor.execute('UPDATE villagers SET location = ? WHERE villager_id = ?', (current_loc, v_id))
-                        conn.commit()
-                        print(f'✅ Moved {v_id} to {current_loc}.')
+                        pending.append((SQL_MOVE_VILLAGER, (current_loc, v_id),
+                                        f'✅ Moved {v_id} to {current_loc}.'))
+                        _villager_cache[v_id] = (job, current_loc)
+                        print(f'Will move {v_id} to {current_loc} when this entry is saved.')
                         return v_id
                     elif move == 'n':
                         print('❌ Villager mismatch. Please enter a different Villager ID.')
@@ -142,12 +236,10 @@ def get_villager_id(cursor, conn, current_loc):
         while True:
             confirm = input(f'\nVillager ID "{v_id}" not found. Add new Librarian at "{current_loc}"? (y/n): ').strip().lower()
             if confirm == 'y':
-                cursor.execute("""
-                    INSERT INTO villagers (villager_id, location, job)
-                    VALUES (?, ?, 'librarian')
-                """, (v_id, current_loc))
-                conn.commit()
-                print(f'✅ Added new Librarian "{v_id}" at "{current_loc}".')
+                pending.append((SQL_INSERT_VILLAGER, (v_id, current_loc),
+                                f'✅ Added new Librarian "{v_id}" at "{current_loc}".'))
+                _villager_cache[v_id] = ('librarian', current_loc)
+                print(f'Will add new Librarian "{v_id}" at "{current_loc}" when this entry is saved.')
                 return v_id
             elif confirm == 'n':
                 print('❌ Action cancelled. Please enter a different Villager ID.')
@@ -163,7 +255,7 @@ def get_enchantment(cursor):
             print('❌ Error: Enchantment cannot be empty. Try again.')
             continue
 
-        cursor.execute('SELECT max_level FROM enchantments WHERE enchantment = ?', (ench,))
+        cursor.execute(SQL_GET_MAX_LEVEL, (ench,))
         result = cursor.fetchone()
 
         if result:
@@ -197,92 +289,121 @@ def get_cost():
 
 # --- MAIN LOGIC ---
 
+def write_pending(conn, cursor, pending, trade=None):
+    """Write queued location/villager changes and the optional trade in one short transaction.
+
+    Returns True if the trade was inserted, False if it duplicates an existing trade.
+    """
+    # Nothing to write, so don't take the write lock
+    if not pending and not trade:
+        return False
+
+    cursor.execute('BEGIN IMMEDIATE')
+    for sql, params, _ in pending:
+        cursor.execute(sql, params)
+
+    inserted = False
+    if trade:
+        # Skip the insert if it would duplicate an existing trade
+        cursor.execute(SQL_INSERT_TRADE_IF_NEW, trade)
+        inserted = cursor.rowcount > 0
+
+    conn.commit()
+
+    # Confirm queued changes only once they are committed
+    for _, _, message in pending:
+        print(message)
+
+    pending.clear()
+    return inserted
+
 def add_librarian_trade(pre_loc=None, pre_v_id=None):
     """Add librarian trade with input validation and database checks."""
 
     print('\n--- 📚 New Librarian Trade Entry ---')
 
+    conn = None
+
     try:
         try:
-            conn = sqlite3.connect(DB_PATH)
+            conn, cursor = get_connection()
+        except SchemaError as e:
+            print(f'❌ Database schema error: {e}')
+            return None, None, 'error'
         except sqlite3.Error as e:
             print(f'❌ Database connection error: {e}')
             return None, None, 'error'
 
-        with conn:
-            cursor = conn.cursor()
-            cursor.execute('PRAGMA foreign_keys = ON;')
+        # Collect all input with reads only; writes are queued so no lock is held while prompting
+        pending = []
 
-            # Get location (skip if provided)
-            if pre_loc:
-                print(f'Location: {pre_loc}')
-                loc = pre_loc
-            else:
-                loc = get_location(cursor, conn)
-
-            # Get villager ID (skip if provided)
-            if pre_v_id:
-                print(f'Villager ID: {pre_v_id}')
-                v_id = pre_v_id
-            else:
-                v_id = get_villager_id(cursor, conn, loc)
+        # Get location (skip if provided)
+        if pre_loc:
+            print(f'Location: {pre_loc}')
+            loc = pre_loc
+        else:
+            loc = get_location(cursor, pending)
 
-            # Check if villager already has 4 trades
-            cursor.execute('SELECT COUNT(*) FROM librarian_trades WHERE villager_id = ?', (v_id,))
-            trade_count = cursor.fetchone()[0]
+        # Get villager ID (skip if provided)
+        if pre_v_id:
+            print(f'Villager ID: {pre_v_id}')
+            v_id = pre_v_id
+        else:
+            v_id = get_villager_id(cursor, loc, pending)
 
-            if trade_count >= 4:
-                print(f'❌ Error: Villager "{v_id}" already has {trade_count} out of 4 trades.')
-                return loc, v_id, 'full'
+        # Check if villager already has 4 trades
+        cursor.execute(SQL_COUNT_TRADES, (v_id, MAX_TRADES))
+        trade_count = cursor.fetchone()[0]
 
-            # Get trade details
-            ench, max_lvl = get_enchantment(cursor)
+        if trade_count >= MAX_TRADES:
+            print(f'❌ Error: Villager "{v_id}" already has {trade_count} out of {MAX_TRADES} trades.')
+            # Keep any new location/villager rows, since they are reused for the next entry
+            write_pending(conn, cursor, pending)
+            return loc, v_id, 'full'
 
-            if max_lvl == 1:
-                print(f'Setting enchantment level for "{ench}" to 1 (max level).')
-                level = 1
-            else:
-                level = get_level(max_lvl)
+        # Get trade details
+        ench, max_lvl = get_enchantment(cursor)
 
-            cost = get_cost()
+        if max_lvl == 1:
+            print(f'Setting enchantment level for "{ench}" to 1 (max level).')
+            level = 1
+        else:
+            level = get_level(max_lvl)
 
-            # Check for duplicates
-            cursor.execute("""
-                SELECT 1 FROM librarian_trades 
-                WHERE villager_id = ? AND enchantment = ? AND enchantment_level = ? AND cost_emeralds = ?
-            """, (v_id, ench, level, cost))
+        cost = get_cost()
 
-            # If duplicate exists, confirm before adding
-            if cursor.fetchone():
-                print(f'⚠️ Warning: This exact trade for Villager "{v_id}" already exists.')
+        # Save to database
+        trade = {'v_id': v_id, 'ench': ench, 'level': level, 'cost': cost}
 
-                while True:
-                    confirm = input('Add duplicate trade anyway? (y/n): ').strip().lower()
-                    if confirm == 'n':
-                        print('❌ Action cancelled. Trade not added.')
-                        return loc, v_id, 'cancelled'
-                    elif confirm == 'y':
-                        break
-                    else:
-                        print('Invalid input. Please enter "y" or "n".')
+        # If duplicate exists, confirm before adding
+        if not write_pending(conn, cursor, pending, trade):
+            print(f'⚠️ Warning: This exact trade for Villager "{v_id}" already exists.')
 
-            # Save to database
-            cursor.execute("""
-                INSERT INTO librarian_trades (villager_id, enchantment, enchantment_level, cost_emeralds)
-                VALUES (?, ?, ?, ?)
-            """, (v_id, ench, level, cost))
+            while True:
+                confirm = input('Add duplicate trade anyway? (y/n): ').strip().lower()
+                if confirm == 'n':
+                    print('❌ Action cancelled. Trade not added.')
+                    return loc, v_id, 'cancelled'
+                elif confirm == 'y':
+                    cursor.execute('BEGIN IMMEDIATE')
+                    cursor.execute(SQL_INSERT_TRADE, (v_id, ench, level, cost))
+                    conn.commit()
+                    break
+                else:
+                    print('Invalid input. Please enter "y" or "n".')
 
-            print(f'✅ Saved: Villager "{v_id}" sells "{ench} {level}" for {cost} emeralds.')
-            return loc, v_id, 'success'
+        print(f'✅ Saved: Villager "{v_id}" sells "{ench} {level}" for {cost} emeralds.')
+        return loc, v_id, 'success'
 
     except Exception as e:
+        if conn:
+            if conn.in_transaction:
+                conn.rollback()
+            # Drop cached villagers that may reflect unwritten or rolled-back changes
+            _villager_cache.clear()
         print(f'\n❌ Error: {e}')
         return None, None, 'error'
 
-    finally:
-        if conn:
-            conn.close()
-
 # --- MAIN EXECUTION ---
 
 if __name__ == '__main__':
@@ -8,54 +8,77 @@ Date: 2026-02-06
 Description:
 This script performs an ETL (Extract, Transform, Load) process to gather
 data about Minecraft enchantments and villager jobs from the latest Minecraft
-client JAR file. The data is extracted directly from the JAR file in memory,
-cleaned, and then loaded into a SQLite database.
+client JAR file. The JAR is streamed into an on-disk cache, the data is
+extracted from it, cleaned, and then loaded into a SQLite database.
 
 Flow:
-    1. Fetch version manifest from piston-meta
+    1. Fetch version manifest from piston-meta (skip the run if unchanged since the last load)
     2. Parse JSON to extract latest release version
     3. Parse JSON to extract URL for latest release's JSON
-    4. Download client.jar into RAM
-    5. Extract enchantment and job data from JAR in memory
+    4. Stream client.jar to disk (or reuse the cached copy for this release)
+    5. Extract enchantment and job data from JAR
     6. Load cleaned data into SQLite database
     7. Print summary of loaded data
 
 Input:
-- Latest Minecraft client JAR file (downloaded into RAM)
+- Latest Minecraft client JAR file (streamed into jar_cache/)
 
 Output:
 - SQLite database file (mc_trading.db) with two tables:
     1. enchantments
     2. jobs
+- HTTP cache sidecar (mc_trading_http_cache.json) with the manifest's ETag/Last-Modified
+- Cached client JAR files (jar_cache/)
 
 Requirements:
 - requests
-- pandas
+- orjson
+- apsw
 """
 
-import io
+import hashlib
 import json
 import logging
 import os
-import sqlite3
+import shutil
 import zipfile
 
-import pandas as pd
+import apsw
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 
 # --- CONFIGURATION ---
 
 DB_NAME = 'mc_trading.db'
 LOG_FILE = 'mc_trading_etl.log'
+HTTP_CACHE_FILE = 'mc_trading_http_cache.json'
+JAR_CACHE_DIR = 'jar_cache'
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 
 DB_PATH = os.path.join(parent_dir, DB_NAME)
 LOG_PATH = os.path.join(parent_dir, LOG_FILE)
+HTTP_CACHE_PATH = os.path.join(parent_dir, HTTP_CACHE_FILE)
+JAR_CACHE_PATH = os.path.join(parent_dir, JAR_CACHE_DIR)
 
 MANIFEST_URL = "https://piston-meta.mojang.com/mc/game/version_manifest.json"
 
+# Paths inside client.jar
+ENCHANTMENT_PREFIX = "data/minecraft/enchantment/"
+TRADEABLE_TAG_PATHS = ("data/minecraft/tags/enchantment/tradeable.json",
+                       "data/minecraft/tags/enchantment/non_treasure.json")
+JOB_SITE_PATH = "data/minecraft/tags/point_of_interest_type/acquirable_job_site.json"
+
+# Shared session so requests to the same Mojang host reuse one keep-alive connection
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+SESSION.headers['User-Agent'] = 'mc-trading-etl/1.0'
+
+# Returned by get_latest_version_url when the manifest hasn't changed since the last load
+NOT_MODIFIED = object()
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -65,14 +88,73 @@ logging.basicConfig(
     ]
 )
 
-def get_latest_version_url():
-    """Fetches version manifest to find the URL for latest release's JSON."""
+def database_is_loaded():
+    """Checks that a previous run left rows in the enchantments table."""
+    if not os.path.exists(DB_PATH):
+        return False
+
+    conn = None
+    try:
+        conn = apsw.Connection(DB_PATH, flags=apsw.SQLITE_OPEN_READONLY)
+        return conn.execute("SELECT EXISTS (SELECT 1 FROM enchantments)").fetchone()[0] == 1
+    except apsw.Error:
+        return False
+    finally:
+        if conn is not None:
+            conn.close()
+
+def load_http_cache():
+    """Loads saved ETag/Last-Modified headers, keyed by URL."""
+    # Without loaded data there is nothing to keep up to date, so force a full download
+    if not database_is_loaded():
+        return {}
+
+    try:
+        with open(HTTP_CACHE_PATH, 'rb') as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return {}
+    except (OSError, orjson.JSONDecodeError) as e:
+        logging.warning(f"Ignoring unreadable HTTP cache {HTTP_CACHE_PATH}: {e}")
+        return {}
+
+def save_http_cache(http_cache):
+    """Saves ETag/Last-Modified headers for the next run."""
+    try:
+        with open(HTTP_CACHE_PATH, 'wb') as f:
+            f.write(orjson.dumps(http_cache, option=orjson.OPT_INDENT_2))
+    except OSError as e:
+        logging.warning(f"Could not save HTTP cache {HTTP_CACHE_PATH}: {e}")
+
+def get_latest_version_url(http_cache):
+    """Fetches version manifest to find the URL for latest release's JSON.
+
+    Sends the validators saved in http_cache and returns NOT_MODIFIED on a 304.
+    New validators are stored in http_cache for the caller to save once the load succeeds.
+    """
     try:
         logging.info(f"Fetching manifest from {MANIFEST_URL}")
-        response = requests.get(MANIFEST_URL, timeout=10)
+
+        cached = http_cache.get(MANIFEST_URL, {})
+        headers = {}
+        if cached.get('ETag'):
+            headers['If-None-Match'] = cached['ETag']
+        if cached.get('Last-Modified'):
+            headers['If-Modified-Since'] = cached['Last-Modified']
+
+        response = SESSION.get(MANIFEST_URL, headers=headers, timeout=10)
+
+        if response.status_code == 304:
+            logging.info("Manifest not modified since last run.")
+            return NOT_MODIFIED
+
         response.raise_for_status()
         data = response.json()
 
+        http_cache[MANIFEST_URL] = {
+            key: response.headers[key] for key in ('ETag', 'Last-Modified') if key in response.headers
+        }
+
         latest_version = data["latest"]["release"]
         logging.info(f"Found latest release version: {latest_version}")
 
@@ -98,91 +180,145 @@ def get_latest_version_url():
         return None
 
 def get_client_jar_url(version_url):
-    """Fetches version-specific JSON to find client.jar download URL."""
+    """Fetches version-specific JSON to find client.jar download URL and SHA-1."""
     try:
         logging.info("Fetching client JAR URL...")
-        response = requests.get(version_url, timeout=10)
+        response = SESSION.get(version_url, timeout=10)
         response.raise_for_status()
         data = response.json()
-        return data["downloads"]["client"]["url"]
+        client = data["downloads"]["client"]
+        return client["url"], client.get("sha1")
     except Exception as e:
         logging.error(f"Error extracting client URL: {e}", exc_info=True)
-        return None
+        return None, None
 
-def extract_data_from_memory(jar_url):
-    """Downloads JAR to RAM and extracts enchantment and job data."""
-    logging.info(f"Downloading client.jar into memory (this may take a moment)...")
+def parse_enchantment(filename, raw):
+    """Parses one enchantment JSON file into a cleaned row, or None if it can't be parsed."""
     try:
-        response = requests.get(jar_url, timeout=10)
+        data = orjson.loads(raw)
+
+        description = data.get('description')
+
+        if not description:
+            raise ValueError("Missing 'description' field")
+
+        if isinstance(description, dict):
+            raw_name = description.get('translate')
+            if not raw_name:
+                raise ValueError("Missing 'translate' key")
+        else:
+            raw_name = str(description)
+
+        clean_name = raw_name.rpartition('.')[2]
+
+        supported_items = data.get('supported_items')
+        clean_items = str(supported_items).rpartition('/')[2] if supported_items else "unknown"
+
+        return {
+            "enchantment": clean_name,
+            "max_level": data.get('max_level'),
+            "supported_items": clean_items
+        }
+
+    except orjson.JSONDecodeError:
+        logging.warning(f"Skipping corrupted JSON file: {filename}")
+        return None
+    except (ValueError, AttributeError) as e:
+        logging.warning(f"Skipping file {filename}: {e}")
+        return None
+
+def file_sha1(path):
+    """Returns the hex SHA-1 digest of a file, read in 1 MiB chunks."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def prune_jar_cache(keep_file):
+    """Deletes cached JARs and partial downloads other than keep_file."""
+    for name in os.listdir(JAR_CACHE_PATH):
+        path = os.path.join(JAR_CACHE_PATH, name)
+        if path != keep_file and name.endswith(('.jar', '.part')):
+            try:
+                os.remove(path)
+                logging.info(f"Removed old cached file {path}")
+            except OSError as e:
+                logging.warning(f"Could not remove old cached file {path}: {e}")
+
+def get_client_jar(jar_url, jar_sha1=None):
+    """Returns the path to client.jar, streaming it to disk only if this release isn't cached."""
+    # Mojang's JAR URLs are content-addressed, so a given URL always serves the same file
+    cache_file = os.path.join(JAR_CACHE_PATH, hashlib.sha1(jar_url.encode()).hexdigest() + '.jar')
+
+    if os.path.exists(cache_file):
+        if not jar_sha1 or file_sha1(cache_file) == jar_sha1:
+            logging.info(f"Using cached client.jar from {cache_file}")
+            return cache_file
+        logging.warning(f"Cached client.jar {cache_file} failed its SHA-1 check. Downloading again.")
+
+    logging.info(f"Downloading client.jar to {cache_file} (this may take a moment)...")
+    os.makedirs(JAR_CACHE_PATH, exist_ok=True)
+    tmp_file = cache_file + '.part'
+
+    with SESSION.get(jar_url, stream=True, timeout=10) as response:
         response.raise_for_status()
-        jar_bytes = io.BytesIO(response.content)
+        response.raw.decode_content = True
+        with open(tmp_file, 'wb') as f:
+            shutil.copyfileobj(response.raw, f, length=1 << 20)
+
+    if jar_sha1 and file_sha1(tmp_file) != jar_sha1:
+        os.remove(tmp_file)
+        raise ValueError(f"Downloaded client.jar does not match SHA-1 {jar_sha1}")
+
+    # Only a complete, verified download is moved into place
+    os.replace(tmp_file, cache_file)
+    prune_jar_cache(cache_file)
+    return cache_file
+
+def extract_data_from_jar(jar_url, jar_sha1=None):
+    """Fetches client.jar and extracts enchantment and job data."""
+    try:
+        jar_path = get_client_jar(jar_url, jar_sha1)
 
         enchant_list = []
         job_list = []
         tradeable_ids = set()
 
-        with zipfile.ZipFile(jar_bytes) as jar:
-            logging.info("Unzipping and parsing files in memory...")
+        with zipfile.ZipFile(jar_path) as jar:
+            logging.info("Unzipping and parsing files...")
+
+            # Read the central directory listing once; files of interest are opened by name
+            jar_names = jar.namelist()
+            jar_name_set = set(jar_names)
 
             # 1. Identify tradeable enchantments from tags
-            for tag_path in ['data/minecraft/tags/enchantment/tradeable.json',
-                             'data/minecraft/tags/enchantment/non_treasure.json']:
-                if tag_path in jar.namelist():
+            for tag_path in TRADEABLE_TAG_PATHS:
+                if tag_path in jar_name_set:
                     with jar.open(tag_path) as tag_file:
-                        tag_data = json.load(tag_file)
+                        tag_data = orjson.loads(tag_file.read())
                         for item in tag_data.get('values', []):
                             if not item.startswith('#'):
-                                    tradeable_ids.add(item.split(':')[-1])
+                                    tradeable_ids.add(item.rpartition(':')[2])
 
             logging.info(f"Found {len(tradeable_ids)} tradeable enchantments.")
 
-            # 2. Extract tradeable enchantments and jobs
-            for file_info in jar.infolist():
-
-                # --- A. ENCHANTMENTS ---
-                if file_info.filename.startswith("data/minecraft/enchantment/") and file_info.filename.endswith(".json"):
-                    with jar.open(file_info) as file:
-                        try:
-                            data = json.load(file)
-
-                            description = data.get('description')
-
-                            if not description:
-                                raise ValueError("Missing 'description' field")
-
-                            if isinstance(description, dict):
-                                raw_name = description.get('translate')
-                                if not raw_name:
-                                    raise ValueError("Missing 'translate' key")
-                            else:
-                                raw_name = str(description)
-
-                            clean_name = raw_name.split('.')[-1]
+            # 2. Extract tradeable enchantments
+            enchant_paths = [name for name in jar_names
+                             if name.startswith(ENCHANTMENT_PREFIX) and name.endswith(".json")]
 
-                            supported_items = data.get('supported_items')
-                            clean_items = str(supported_items).split('/')[-1] if supported_items else "unknown"
+            for path in enchant_paths:
+                enchant = parse_enchantment(path, jar.read(path))
+                if enchant and enchant["enchantment"] in tradeable_ids:
+                    enchant_list.append(enchant)
 
-                            if clean_name in tradeable_ids:
-                                enchant_list.append({
-                                    "enchantment": clean_name,
-                                    "max_level": data.get('max_level'),
-                                    "supported_items": clean_items
-                                })
+            # 3. Extract jobs
+            if JOB_SITE_PATH in jar_name_set:
+                with jar.open(JOB_SITE_PATH) as file:
+                    data = orjson.loads(file.read())
 
-                        except json.JSONDecodeError:
-                            logging.warning(f"Skipping corrupted JSON file: {file_info.filename}")
-                            continue
-                        except (ValueError, AttributeError) as e:
-                            logging.warning(f"Skipping file {file_info.filename}: {e}")
-                            continue
-
-                # --- B. JOBS ---
-                elif file_info.filename == "data/minecraft/tags/point_of_interest_type/acquirable_job_site.json":
-                    with jar.open(file_info) as file:
-                        data = json.load(file)
-
-                        for raw_job in data.get('values', []):
-                            job_list.append({'job': raw_job.split(':')[-1]})
+                    for raw_job in data.get('values', []):
+                        job_list.append({'job': raw_job.rpartition(':')[2]})
 
         return enchant_list, job_list
 
@@ -195,49 +331,77 @@ def extract_data_from_memory(jar_url):
 if __name__ == "__main__":
     logging.info("--- Starting ETL Pipeline ---")
 
-    version_url = get_latest_version_url()
+    http_cache = load_http_cache()
+    version_url = get_latest_version_url(http_cache)
+
+    if version_url is NOT_MODIFIED:
+        logging.info("Database is already up to date.")
 
-    if version_url:
-        client_url = get_client_jar_url(version_url)
+    elif version_url:
+        client_url, client_sha1 = get_client_jar_url(version_url)
 
         if client_url:
-            enchantments, jobs = extract_data_from_memory(client_url)
+            enchantments, jobs = extract_data_from_jar(client_url, client_sha1)
 
             # 2. Database Loading
             if enchantments and jobs:
+                conn = None
                 try:
-                    with sqlite3.connect(DB_PATH) as conn:
-                        cursor = conn.cursor()
-
-                        logging.info(f"Connecting to database at: {DB_PATH}")
-
-                        cursor.execute("DROP TABLE IF EXISTS enchantments")
-                        cursor.execute("DROP TABLE IF EXISTS jobs")
-
-                        cursor.execute("""
-                            CREATE TABLE IF NOT EXISTS enchantments (
-                                enchantment TEXT PRIMARY KEY,
-                                max_level INTEGER,
-                                supported_items TEXT
-                            )
-                        """)
-
-                        cursor.execute("""
-                            CREATE TABLE IF NOT EXISTS jobs (
-                                job TEXT PRIMARY KEY)
-                        """)
-
-                        df_ench = pd.DataFrame(enchantments).sort_values("enchantment")
-                        df_ench.to_sql('enchantments', conn, if_exists='append', index=False)
-
-                        df_jobs = pd.DataFrame(jobs).sort_values("job")
-                        df_jobs.to_sql('jobs', conn, if_exists='append', index=False)
-
-                        logging.info(f"SUCCESS: Loaded {len(df_ench)} tradeable enchantments and {len(df_jobs)} possible jobs.")
-                
-                except sqlite3.Error as e:
+                    logging.info(f"Connecting to database at: {DB_PATH}")
+                    conn = apsw.Connection(DB_PATH)
+                    # Wait for other writers like the stdlib sqlite3 default instead of failing at once
+                    conn.set_busy_timeout(5000)
+
+                    conn.pragma("journal_mode", "WAL")
+                    conn.pragma("synchronous", "NORMAL")
+                    conn.pragma("temp_store", "MEMORY")
+                    conn.pragma("cache_size", -65536)  # 64 MiB
+                    conn.pragma("mmap_size", 268435456)  # 256 MiB
+
+                    cursor = conn.cursor()
+
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS enchantments (
+                            enchantment TEXT PRIMARY KEY,
+                            max_level INTEGER,
+                            supported_items TEXT
+                        )
+                    """)
+
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS jobs (
+                            job TEXT PRIMARY KEY)
+                    """)
+
+                    enchantments.sort(key=lambda e: e["enchantment"])
+                    jobs.sort(key=lambda j: j["job"])
+
+                    # apsw's context manager wraps the block in a single transaction.
+                    # Tables are emptied rather than dropped so their indexes persist.
+                    with conn:
+                        cursor.execute("DELETE FROM enchantments")
+                        cursor.execute("DELETE FROM jobs")
+
+                        cursor.executemany(
+                            "INSERT INTO enchantments (enchantment, max_level, supported_items) VALUES (?, ?, ?)",
+                            ((e["enchantment"], e["max_level"], e["supported_items"]) for e in enchantments)
+                        )
+                        cursor.executemany(
+                            "INSERT INTO jobs (job) VALUES (?)",
+                            ((j["job"],) for j in jobs)
+                        )
+
+                    logging.info(f"SUCCESS: Loaded {len(enchantments)} tradeable enchantments and {len(jobs)} possible jobs.")
+
+                    save_http_cache(http_cache)
+
+                except apsw.Error as e:
                     logging.error(f"Database error: {e}", exc_info=True)
 
+                finally:
+                    if conn is not None:
+                        conn.close()
+
             else:
                 logging.warning("No data extracted. Database not updated.")
 